@@ -6,24 +6,160 @@ of the sqlite3 database is fixed and adaptations to other needs require changes
 """
 
 
-import sys
 import sqlite3
 from datetime import datetime
-from dateutil import parser
+from multiprocessing.pool import ThreadPool
+import numpy
 
 import functions
 import query as q
 import results
 import request as r
-import nodes
 import specmodel
 from settings import *
 
 LOGLEVEL = 'full'
 
+# Format of timestamps returned by sqlite's datetime() - function (UTC)
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Number of rows which are collected before they are inserted with one executemany
+INSERT_BATCH_SIZE = 1000
+
+# Progress of long running loops is reported every PROGRESS_INTERVAL iterations
+PROGRESS_INTERVAL = 1000
+
+# Maximum number of values which are bound to one 'IN (...)' - list. Has to be
+# below the limit of host parameters of sqlite (SQLITE_MAX_VARIABLE_NUMBER).
+MAX_IN_LIST_SIZE = 500
+
 # List of Temperatures for which the Partitionfunction is stored in the sqlite database.
 Temperatures = [1.072, 1.148, 1.230, 1.318, 1.413, 1.514, 1.622, 1.738, 1.862, 1.995, 2.138, 2.291, 2.455, 2.630, 2.725, 2.818, 3.020, 3.236, 3.467, 3.715, 3.981, 4.266, 4.571, 4.898, 5.000, 5.248, 5.623, 6.026, 6.457, 6.918, 7.413, 7.943, 8.511, 9.120, 9.375, 9.772, 10.471, 11.220, 12.023, 12.882, 13.804, 14.791, 15.849, 16.982, 18.197, 18.750, 19.498, 20.893, 22.387, 23.988, 25.704, 27.542, 29.512, 31.623, 33.884, 36.308, 37.500, 38.905, 41.687, 44.668, 47.863, 51.286, 54.954, 58.884, 63.096, 67.608, 72.444, 75.000, 77.625, 83.176, 89.125, 95.499, 102.329, 109.648, 117.490, 125.893, 134.896, 144.544, 150.000, 154.882, 165.959, 177.828, 190.546, 204.174, 218.776, 225.000, 234.423, 251.189, 269.153, 288.403, 300.000, 309.030, 331.131, 354.813, 380.189, 407.380, 436.516, 467.735, 500.000, 501.187, 537.032, 575.440, 616.595, 660.693, 707.946, 758.578, 812.831, 870.964, 933.254, 1000.000, ]
 
+def get_pf_column(temperature):
+    """
+    Returns the name of the column in the Partitionfunctions - table which contains
+    the values for the given temperature, e.g. PF_300_000 for 300 K.
+
+    :ivar float temperature: Temperature
+    :rtype: str
+    """
+    return ("PF_%.3lf" % float(temperature)).replace('.', '_')
+
+# Columns of the Partitionfunctions - table in the order of Temperatures and
+# the position of each temperature in this list.
+TEMPERATURE_COLUMNS = tuple([get_pf_column(temperature) for temperature in Temperatures])
+TEMPERATURE_INDEX = dict([(temperature, index) for index, temperature in enumerate(Temperatures)])
+TEMPERATURE_ARRAY = numpy.array(Temperatures, dtype = numpy.float64)
+TEMPERATURE_ARRAY.flags.writeable = False
+
+#------------------------------------------------------------------------
+# Statements which are executed for each transition or specie. They are defined
+# only once, so that the statement cache of the connection is always hit.
+
+SQL_INSERT_TRANSITION = "INSERT INTO Transitions (T_Name, T_Frequency, T_EinsteinA, T_Uncertainty, T_EnergyLower, " \
+                        "T_UpperStateDegeneracy, T_HFS, T_UpperStateQuantumNumbers, T_LowerStateQuantumNumbers) " \
+                        "VALUES (?,?,?,?,?,?,?,?,?)"
+
+SQL_INSERT_PF_ATOM = "INSERT INTO Partitionfunctions (PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_Comment, " \
+                     "PF_ResourceID, PF_URL, PF_Timestamp) VALUES (?,?,?,?,?,?,?)"
+
+SQL_INSERT_PF_MOLECULE = "INSERT INTO Partitionfunctions (PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_HFS, " \
+                         "PF_NuclearSpinIsomer, PF_Comment, PF_ResourceID, PF_URL, PF_Timestamp) VALUES (?,?,?,?,?,?,?,?,?)"
+
+# Updates the partition function for all temperatures of one specie at once
+SQL_UPDATE_PF_ALL_TEMPERATURES = "UPDATE Partitionfunctions SET %s WHERE PF_SpeciesID=?" % \
+    ", ".join(["%s=?" % column for column in TEMPERATURE_COLUMNS])
+
+# Indexes on the Partitionfunctions - table which have been added to the layout. They
+# are created if they do not exist, so that databases which have been created before
+# get them as well (see Database.create_indexes).
+SQL_CREATE_PF_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS 'IDX_PF_SpeciesID' ON Partitionfunctions (PF_SpeciesID, PF_NuclearSpinIsomer);",
+    "CREATE INDEX IF NOT EXISTS 'IDX_PF_ResourceID' ON Partitionfunctions (PF_ResourceID);",
+    )
+
+# Indexes on the Transitions - table. They are dropped while the database is filled
+# initially (see prepare_for_bulk_import) and built once afterwards. If the fill has
+# been aborted, they are built by Database.create_indexes on the next update.
+SQL_CREATE_TRANSITION_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS 'IDX_T_Name' ON Transitions (T_Name, T_Frequency, T_EnergyLower);",
+    "CREATE INDEX IF NOT EXISTS 'IDX_T_Frequency' ON Transitions (T_Frequency, T_EnergyLower);",
+    )
+SQL_DROP_TRANSITION_INDEXES = (
+    "DROP INDEX IF EXISTS IDX_T_Name;",
+    "DROP INDEX IF EXISTS IDX_T_Frequency;",
+    )
+
+# Statements which update the partition function of one nuclear spin isomer of a specie
+# for several temperatures at once. They are created on first use and are keyed by the
+# positions of the temperatures in Temperatures (see get_pf_update_statement).
+SQL_UPDATE_PF_NSI = {}
+
+def get_pf_update_statement(indexes):
+    """
+    Returns the statement which updates the partition function of one nuclear spin isomer
+    of a specie for the temperatures at the given positions in Temperatures. The parameters
+    are the values in the order of indexes, followed by PF_SpeciesID and the nuclear spin isomer.
+
+    :ivar tuple indexes: sorted positions of the temperatures in Temperatures
+    :rtype: str
+    """
+    sql = SQL_UPDATE_PF_NSI.get(indexes)
+    if sql is None:
+        sql = "UPDATE Partitionfunctions SET %s WHERE PF_SpeciesID=? AND IFNULL(PF_NuclearSpinIsomer,'')=?" % \
+            ", ".join(["%s=?" % TEMPERATURE_COLUMNS[index] for index in indexes])
+        SQL_UPDATE_PF_NSI[indexes] = sql
+    return sql
+
+# Timestamps which have been parsed by parse_timestamp
+PARSED_TIMESTAMPS = {}
+
+def parse_timestamp(timestamp):
+    """
+    Converts a timestamp returned by sqlite's datetime() - function into a timezone aware
+    datetime instance (UTC). Entries which have been inserted together share their timestamp,
+    therefore each distinct value is parsed only once.
+
+    :ivar str timestamp: timestamp in the format TIMESTAMP_FORMAT
+    :rtype: datetime.datetime
+    """
+    value = PARSED_TIMESTAMPS.get(timestamp)
+    if value is None:
+        from dateutil import tz
+        value = datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo = tz.tzutc())
+        PARSED_TIMESTAMPS[timestamp] = value
+    return value
+
+def request_lastmodified(node_and_query):
+    """
+    Requests the 'last-modified' date of a query from a VAMDC node. A new request instance is
+    created for each call, so that the function can be called from several threads at once.
+
+    Nothing is printed, because the output of several threads would be mixed. If no date is
+    available, the reason is returned instead and has to be reported by the caller.
+
+    :ivar tuple node_and_query: (nodes.Node, query string)
+    :return: (request, last-modified date or None, exception raised by the request or None,
+              reason why no date is available or None)
+    :rtype: tuple
+    """
+    node, query_string = node_and_query
+    request = r.Request(node = node, query = query_string)
+    try:
+        changedate = request.getlastmodified(verbose = False)
+    except Exception as e:
+        return request, None, e, None
+    reason = None
+    if changedate is None:
+        if request.headers.has_key('last-modified'):
+            reason = "Could not parse date %s" % request.headers['last-modified']
+        elif request.status == 408:
+            reason = "TIMEOUT"
+        elif request.status != 200:
+            reason = "STATUS: %d" % request.status
+    return request, changedate, None, reason
+
 #DATABASE_FILE = "cdms_sqlite.db"
 ##========================================================================
 class Database(object):
@@ -34,20 +170,39 @@ class Database(object):
     :ivar sqlite3.Connection conn: connection handler to the sqlite database
     """
     ##********************************************************************
-    def __init__(self, database_file = DATABASE_FILE):
+    def __init__(self, database_file = DATABASE_FILE, pragmas = SQLITE_PRAGMAS):
         """
         The connection to the sqlite3 database is established during initialization of
         the Database-Instance. A new database will be created if it does not exist. 
  
         :ivar str database_file: Path to the sqlite3 database file. The value given in the
                              settings.py - file will be used as default.
+        :ivar list pragmas: PRAGMA - statements which are executed on the connection. The
+                            statements defined in SQLITE_PRAGMAS (settings.py) are used by
+                            default; an empty list keeps the defaults of sqlite (e.g. rollback
+                            journal and synchronous=FULL). Note that journal_mode=WAL is stored
+                            in the database file and persists.
+
+        The statement cache of the connection is large enough to hold all statements
+        used in this module, so that they are only prepared once.
+        The connection is in autocommit mode; transactions are started explicitly
+        with BEGIN where several statements belong together.
         """
         try:
-            self.conn = sqlite3.connect(database_file)
+            self.conn = sqlite3.connect(database_file, isolation_level = None, cached_statements = 256)
         except sqlite3.Error as e:
             print " "
             print "Can not connect to sqlite3 databse %s." % database_file
             print "Error: %s" % (str(e))
+            return
+
+        # a pragma which can not be applied (e.g. journal_mode=WAL on a read-only
+        # filesystem) leaves the default of sqlite in place
+        for pragma in pragmas:
+            try:
+                self.conn.execute(pragma)
+            except sqlite3.Error as e:
+                print "Could not apply '%s': %s" % (pragma, str(e))
         return
 
     ##********************************************************************
@@ -63,10 +218,13 @@ class Database(object):
         """
 
         cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
         #----------------------------------------------------------
         # drop tables if they exist
-        stmts = ("DROP TABLE IF EXISTS Partitionfunctions;",
-                 "DROP TABLE IF EXISTS Transitions;",)
+        stmts = ("DROP VIEW IF EXISTS PartitionfunctionValues;",
+                 "DROP TABLE IF EXISTS Partitionfunctions;",
+                 "DROP TABLE IF EXISTS Transitions;",
+                 "DROP TABLE IF EXISTS Temperatures;",)
 
         for stmt in stmts:
             cursor.execute(stmt)
@@ -97,188 +255,169 @@ class Database(object):
         PF_SpeciesID TEXT,
         PF_NuclearSpinIsomer TEXT,
         PF_HFS TEXT,
-        PF_1_072 REAL,
-        PF_1_148 REAL,
-        PF_1_230 REAL,
-        PF_1_318 REAL,
-        PF_1_413 REAL,
-        PF_1_514 REAL,
-        PF_1_622 REAL,
-        PF_1_738 REAL,
-        PF_1_862 REAL,
-        PF_1_995 REAL,
-        PF_2_138 REAL,
-        PF_2_291 REAL,
-        PF_2_455 REAL,
-        PF_2_630 REAL,
-        PF_2_725 REAL,
-        PF_2_818 REAL,
-        PF_3_020 REAL,
-        PF_3_236 REAL,
-        PF_3_467 REAL,
-        PF_3_715 REAL,
-        PF_3_981 REAL,
-        PF_4_266 REAL,
-        PF_4_571 REAL,
-        PF_4_898 REAL,
-        PF_5_000 REAL,
-        PF_5_248 REAL,
-        PF_5_623 REAL,
-        PF_6_026 REAL,
-        PF_6_457 REAL,
-        PF_6_918 REAL,
-        PF_7_413 REAL,
-        PF_7_943 REAL,
-        PF_8_511 REAL,
-        PF_9_120 REAL,
-        PF_9_375 REAL,
-        PF_9_772 REAL,
-        PF_10_471 REAL,
-        PF_11_220 REAL,
-        PF_12_023 REAL,
-        PF_12_882 REAL,
-        PF_13_804 REAL,
-        PF_14_791 REAL,
-        PF_15_849 REAL,
-        PF_16_982 REAL,
-        PF_18_197 REAL,
-        PF_18_750 REAL,
-        PF_19_498 REAL,
-        PF_20_893 REAL,
-        PF_22_387 REAL,
-        PF_23_988 REAL,
-        PF_25_704 REAL,
-        PF_27_542 REAL,
-        PF_29_512 REAL,
-        PF_31_623 REAL,
-        PF_33_884 REAL,
-        PF_36_308 REAL,
-        PF_37_500 REAL,
-        PF_38_905 REAL,
-        PF_41_687 REAL,
-        PF_44_668 REAL,
-        PF_47_863 REAL,
-        PF_51_286 REAL,
-        PF_54_954 REAL,
-        PF_58_884 REAL,
-        PF_63_096 REAL,
-        PF_67_608 REAL,
-        PF_72_444 REAL,
-        PF_75_000 REAL,
-        PF_77_625 REAL,
-        PF_83_176 REAL,
-        PF_89_125 REAL,
-        PF_95_499 REAL,
-        PF_102_329 REAL,
-        PF_109_648 REAL,
-        PF_117_490 REAL,
-        PF_125_893 REAL,
-        PF_134_896 REAL,
-        PF_144_544 REAL,
-        PF_150_000 REAL,
-        PF_154_882 REAL,
-        PF_165_959 REAL,
-        PF_177_828 REAL,
-        PF_190_546 REAL,
-        PF_204_174 REAL,
-        PF_218_776 REAL,
-        PF_225_000 REAL,
-        PF_234_423 REAL,
-        PF_251_189 REAL,
-        PF_269_153 REAL,
-        PF_288_403 REAL,
-        PF_300_000 REAL,
-        PF_309_030 REAL,
-        PF_331_131 REAL,
-        PF_354_813 REAL,
-        PF_380_189 REAL,
-        PF_407_380 REAL,
-        PF_436_516 REAL,
-        PF_467_735 REAL,
-        PF_500_000 REAL,
-        PF_501_187 REAL,
-        PF_537_032 REAL,
-        PF_575_440 REAL,
-        PF_616_595 REAL,
-        PF_660_693 REAL,
-        PF_707_946 REAL,
-        PF_758_578 REAL,
-        PF_812_831 REAL,
-        PF_870_964 REAL,
-        PF_933_254 REAL,
-        PF_1000_000 REAL,
+        %s,
         PF_ResourceID TEXT,
         PF_URL TEXT,
         PF_Comment TEXT,
-        PF_Timestamp)"""
-
+        PF_Timestamp)""" % ",\n        ".join(["%s REAL" % column for column in TEMPERATURE_COLUMNS])
+
+        # Temperatures for which partition functions are stored and the name of the column
+        # in the Partitionfunctions - table which contains the values
+        sql_create_temperatures = """CREATE TABLE Temperatures (
+        T_Index INTEGER PRIMARY KEY,
+        T_Value REAL,
+        T_Column TEXT) """
+
+        # narrow representation (one row per name and temperature) of the partition functions
+        sql_create_pfvalues = "CREATE VIEW PartitionfunctionValues AS %s" % \
+            " UNION ALL ".join(["SELECT PF_Name, %d AS T_Index, %s AS PF_Value FROM Partitionfunctions" % (index, column)
+                                for index, column in enumerate(TEMPERATURE_COLUMNS)])
+
+        # IDX_T_Name and IDX_T_Frequency are created from SQL_CREATE_TRANSITION_INDEXES,
+        # IDX_PF_SpeciesID and IDX_PF_ResourceID from SQL_CREATE_PF_INDEXES.
+        # IDX_T_Name serves species-scoped lookups (transitions of one entry, ordered or
+        # restricted by frequency) and deletes by name. IDX_T_Frequency serves
+        # frequency-range queries across all species. IDX_PF_SpeciesID serves updates and
+        # deletes of all entries of a specie; it includes the nuclear spin isomer so that
+        # updates of one isomer are resolved from the index alone. IDX_PF_ResourceID serves
+        # the lookup of the nodes.
         sql_create_idx_pfname = "CREATE INDEX 'IDX_PF_Name' ON Partitionfunctions (PF_Name);"
-        sql_create_idx_tname = "CREATE INDEX 'IDX_T_Name' ON Transitions (T_Name, T_Frequency, T_EnergyLower);"
-        sql_create_idx_freq = "CREATE INDEX 'IDX_T_Frequency' ON Transitions (T_Frequency, T_EnergyLower);"
 
         cursor.execute(sql_create_transitions)
         cursor.execute(sql_create_partitionfunctions)
+        cursor.execute(sql_create_temperatures)
+        cursor.executemany("INSERT INTO Temperatures (T_Index, T_Value, T_Column) VALUES (?,?,?)",
+                           [(index, Temperatures[index], column) for index, column in enumerate(TEMPERATURE_COLUMNS)])
+        cursor.execute(sql_create_pfvalues)
         cursor.execute(sql_create_idx_pfname)
-        cursor.execute(sql_create_idx_tname)
-        cursor.execute(sql_create_idx_freq)
+        for stmt in SQL_CREATE_PF_INDEXES:
+            cursor.execute(stmt)
+        for stmt in SQL_CREATE_TRANSITION_INDEXES:
+            cursor.execute(stmt)
+        self.conn.commit()
         #-------------------------------------------------------------
 
         return
+
+    ##********************************************************************
+    def create_indexes(self):
+        """
+        Creates the indexes which have been added to the layout of the database after it
+        has been created by create_structure and the indexes on the Transitions - table,
+        which are missing if a bulk import has been aborted. Existing indexes are left
+        untouched.
+        """
+        cursor = self.conn.cursor()
+        for stmt in SQL_CREATE_PF_INDEXES + SQL_CREATE_TRANSITION_INDEXES:
+            cursor.execute(stmt)
+
+    ##********************************************************************
+    def prepare_for_bulk_import(self):
+        """
+        Drops the indexes on the Transitions - table, so that inserted transitions do not
+        have to be added to them one by one. finalize_bulk_import has to be called
+        afterwards to build them again.
+        """
+        cursor = self.conn.cursor()
+        for stmt in SQL_DROP_TRANSITION_INDEXES:
+            cursor.execute(stmt)
+
+    ##********************************************************************
+    def finalize_bulk_import(self):
+        """
+        Builds the indexes on the Transitions - table which have been dropped by
+        prepare_for_bulk_import and updates the statistics of the query planner.
+        """
+        cursor = self.conn.cursor()
+        for stmt in SQL_CREATE_TRANSITION_INDEXES:
+            cursor.execute(stmt)
+        cursor.execute("ANALYZE")
+
+    ##********************************************************************
+    def get_partitionfunction(self, name, temperature):
+        """
+        Returns the value of the partition function of an entry for one of the
+        temperatures listed in Temperatures.
+
+        :ivar str name: Name of the entry (PF_Name)
+        :ivar float temperature: Temperature
+        :return: value of the partition function or None if it is not available
+        :rtype: float
+        """
+        if float(temperature) not in TEMPERATURE_INDEX:
+            print "Partition function is not stored for temperature %s" % str(temperature)
+            return None
+
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT %s FROM Partitionfunctions WHERE PF_Name = ?" % TEMPERATURE_COLUMNS[TEMPERATURE_INDEX[float(temperature)]], (name, ))
+        row = cursor.fetchone()
+        cursor.close()
+        if row is None:
+            return None
+        return row[0]
     
 
     ##********************************************************************
-    def check_for_updates(self, node):
+    def check_for_updates(self, node, quiet = False):
         """
         Checks for each database entry if an update for the molecular or atomic specie is available in the
         specified VAMDC database node. 
 
         :ivar nodes.Node node: VAMDC database node which will be checked for updates 
+        :ivar boolean quiet: Report only entries which have an update or could not be checked if True.
+                             Otherwise the result of the check is reported for each entry.
         """
-
         count_updates = 0
         counter = 0
         #species_list = []
         cursor = self.conn.cursor()
-        cursor.execute("SELECT PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, datetime(PF_Timestamp) FROM Partitionfunctions ")
+        cursor.row_factory = sqlite3.Row
+        cursor.execute("SELECT PF_Name, PF_SpeciesID, datetime(PF_Timestamp) AS PF_Timestamp FROM Partitionfunctions ")
         rows = cursor.fetchall()
         num_rows = len(rows)
         query = q.Query()
-        request = r.Request()
 
-        for row in rows:
-            counter += 1
-            print "%5d/%5d: Check specie %-55s (%-15s): " % (counter, num_rows, row[0], row[1]),
-            #id = row[1]
-            vamdcspeciesid = row[2]
-#            query_string = "SELECT ALL WHERE VAMDCSpeciesID='%s'" % vamdcspeciesid
-            query_string = "SELECT ALL WHERE SpeciesID=%s" % row[1][6:]
-            request.setquery(query_string)
-            request.setnode(node)
+        # the requests are independent of each other and are sent in parallel
+        queries = [(node, "SELECT ALL WHERE SpeciesID=%s" % row['PF_SpeciesID'][6:]) for row in rows]
+        pool = ThreadPool(NUM_REQUEST_THREADS)
 
-            try:
-                changedate = request.getlastmodified()
-            except r.TimeOutError:
-                print "TIMEOUT"
-                continue
-            except r.NoContentError:
-                print "ENTRY OUTDATED" 
-                changedate = None
-                continue
-            except Exception as e:
-                print "Error in getlastmodified: %s " % str(e)
-                print "Status - code: %s" % str(request.status)
-                changedate = None
-                continue
+        def report(message):
+            """
+            Prints the result of the check of the current entry.
+            """
+            print "%5d/%5d: Check specie %-55s (%-15s): " % (counter, num_rows, row['PF_Name'], row['PF_SpeciesID']), message
 
-            tstamp = parser.parse(row[3] + " GMT")
-            if changedate is None:
-                print " -- UNKNOWN (Could not retrieve information)"
-                continue
-            if tstamp < changedate:
-                print " -- UPDATE AVAILABLE "
-                count_updates += 1
-            else:
-                print " -- up to date"
+        try:
+            for request, changedate, error, reason in pool.imap(request_lastmodified, queries):
+                row = rows[counter]
+                counter += 1
+                if quiet and counter % PROGRESS_INTERVAL == 0:
+                    print "%5d/%5d entries checked" % (counter, num_rows)
+
+                if isinstance(error, r.TimeOutError):
+                    report("TIMEOUT")
+                    continue
+                elif isinstance(error, r.NoContentError):
+                    report("ENTRY OUTDATED")
+                    continue
+                elif error is not None:
+                    report("Error in getlastmodified: %s " % str(error))
+                    print "Status - code: %s" % str(request.status)
+                    continue
+
+                tstamp = parse_timestamp(row['PF_Timestamp'])
+                if changedate is None:
+                    report(" -- UNKNOWN (%s)" % (reason or "Could not retrieve information"))
+                    continue
+                if tstamp < changedate:
+                    report(" -- UPDATE AVAILABLE ")
+                    count_updates += 1
+                elif not quiet:
+                    report(" -- up to date")
+        finally:
+            # the remaining requests are not sent if the loop has been left early
+            pool.terminate()
+            pool.join()
 
         if count_updates == 0:
             print "\r No updates for your entries available"
@@ -296,19 +435,17 @@ class Database(object):
         counter = 0
         cursor = self.conn.cursor()
 
+        # species-ids which are already stored in the database
+        cursor.execute("SELECT DISTINCT PF_SpeciesID FROM Partitionfunctions")
+        existing_ids = set([row[0] for row in cursor.fetchall()])
+
         request = r.Request(node = node)
         result = request.getspecies()
                 
         for id in result.data['Molecules']:
-            try:
-                cursor.execute("SELECT PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_Timestamp FROM Partitionfunctions WHERE PF_SpeciesID=?", [(id)])
-                exist = cursor.fetchone()
-                if exist is None:
-                    print "ID: %s" % result.data['Molecules'][id]
-                    counter += 1
-            except Exception as e:
-                print("Error in check species: %s" % str(e))
-                print id
+            if id not in existing_ids:
+                print "ID: %s" % result.data['Molecules'][id]
+                counter += 1
         print "There are %d new species available" % counter
 
     ##********************************************************************
@@ -318,34 +455,39 @@ class Database(object):
         """
         cursor = self.conn.cursor()
         cursor.execute("SELECT PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_Timestamp FROM Partitionfunctions")
-        rows = cursor.fetchall()
-        for row in rows:
+        for row in cursor:
             print "%-10s %-60s %20s %s" % (row[1], row[0], row[2], row[3])
 
 
     ##********************************************************************
-    def delete_species(self, speciesid):
+    def delete_species(self, speciesid, commit = True):
         """
-        Deletes species stored in the database
+        Deletes species stored in the database. Transitions and entries in the Partitionfunctions
+        table are removed with one statement each.
 
         :ivar str speciesid: Id of the Specie
+        :ivar boolean commit: if True the delete is performed in its own transaction. Otherwise
+                              it becomes part of the transaction of the caller.
+        :return: names (PF_Name) of the deleted entries
+        :rtype: list
         """
-        deleted_species = []
         cursor = self.conn.cursor()
+        if commit:
+            cursor.execute('BEGIN IMMEDIATE')
         cursor.execute("SELECT PF_Name FROM Partitionfunctions WHERE PF_SpeciesID = ?", (speciesid, ))
-        rows = cursor.fetchall()
-        for row in rows:
-            deleted_species.append(row[0])
-            cursor.execute("DELETE FROM Transitions WHERE T_Name = ?", (row[0], ))
-            cursor.execute("DELETE FROM Partitionfunctions WHERE PF_Name = ?", (row[0], ))
+        deleted_species = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM Transitions WHERE T_Name IN "
+                       "(SELECT PF_Name FROM Partitionfunctions WHERE PF_SpeciesID = ?)", (speciesid, ))
+        cursor.execute("DELETE FROM Partitionfunctions WHERE PF_SpeciesID = ?", (speciesid, ))
 
-        self.conn.commit()
+        if commit:
+            self.conn.commit()
         cursor.close()
 
         return deleted_species
 
     ##********************************************************************
-    def insert_species_data(self, species, node, update=False):
+    def insert_species_data(self, species, node, update=False, names_black_list=None):
         """
         Checks the VAMDC database node for new species and inserts them into the local database
 
@@ -353,39 +495,30 @@ class Database(object):
         :ivar nodes.Node node: vamdc-node / type: instance(nodes.node)
         :ivar boolean update:  if True then all entries in the local database with the same
                                species-id will be deleted before the insert is performed.
+        :ivar set names_black_list: names of the entries in the database (see get_names). It is
+                                    kept up to date, so that it can be passed to further calls.
+                                    The names are read from the database if it is None.
         """
 
-        # create a list of names. New names have not to be in that list
-        names_black_list = []
-        
-        cursor = self.conn.cursor()
-        cursor.execute("SELECT PF_Name FROM Partitionfunctions")
-        rows = cursor.fetchall()
-        for row in rows:
-            names_black_list.append(row[0])
+        # create a set of names. New names have not to be in that set
+        if names_black_list is None:
+            names_black_list = self.get_names()
 
         #----------------------------------------------------------
         # Create a list of species for which transitions will be
         # retrieved and inserted in the database.
         # Species have to be in the Partitionfunctions - table
 
-        if not functions.isiterable(species):
+        # if species is a dictionary (e.g. specmodel.Molecules)
+        # then iterate over the species-instances instead of the keys.
+        if isinstance(species, dict):
+            species = species.values()
+        elif not functions.isiterable(species):
             species = [species]
 
         #--------------------------------------------------------------
 
         for specie in species:
-            # if species is a dictionary (e.g. specmodel.Molecules)
-            # then get the species-instance instead of only the key.
-            if isinstance(species, dict):
-                specie = species[specie]
-                
-            num_transitions = {}
-            # will contain a list of names which belong to one specie
-            species_names = {}
-            # list will contain species whose insert-failed
-            species_with_error = []
-
             # check if specie is of type Molecule
             if isinstance(specie, specmodel.Molecule):
                 speciesid = specie.SpeciesID
@@ -427,275 +560,431 @@ class Database(object):
             #---------------------------------------
 
             cursor = self.conn.cursor()
-            cursor.execute('BEGIN TRANSACTION')
-
-            #------------------------------------------------------------------------------------------------------
-            # if update is allowed then all entries in the database for the given species-id will be
-            # deleted, and thus replaced by the new data
-            if update:
-                if speciesid is None:
-                    for sid in result.data['Molecules'].keys() + result.data['Atoms'].keys():
-                        deleted_species = self.delete_species(sid)
-                        for ds in deleted_species:
-                            names_black_list.remove(ds)
-                else:
-                    deleted_species = self.delete_species(speciesid)
-                    for ds in deleted_species:
-                        names_black_list.remove(ds)
-
-            #------------------------------------------------------------------------------------------------------
-            
-            #------------------------------------------------------------------------------------------------------
-            # Insert all transitions
-            num_transitions_found = len(result.data['RadiativeTransitions'])
-            counter_transitions = 0
-            for trans in result.data['RadiativeTransitions']:
-                counter_transitions+=1
-                if LOGLEVEL == 'full':
-                    print("\r insert transition %d of %d" % (counter_transitions, num_transitions_found))
-                # data might contain transitions for other species (if query is based on ichikey/vamdcspeciesid).
-                # Insert transitions only if they belong to the correct specie
-
-                if result.data['RadiativeTransitions'][trans].SpeciesID == speciesid or speciesid is None:
-                    id = str(result.data['RadiativeTransitions'][trans].SpeciesID)
-                    # if an error has occured already then there will be no further insert
-                    if id in species_with_error:
-                        continue
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                self.insert_result_data(cursor, result, speciesid, node, names_black_list, update = update)
+                self.conn.commit()
+            except:
+                self.conn.rollback()
+                # the names of the rolled back entries have been changed in the set already
+                names_black_list.clear()
+                names_black_list.update(self.get_names())
+                raise
+            cursor.close()
 
-                    # Get upper and lower state from the states table
-                    try:
-                        upper_state = result.data['States']["%s" % result.data['RadiativeTransitions'][trans].UpperStateRef]
-                        lower_state = result.data['States']["%s" % result.data['RadiativeTransitions'][trans].LowerStateRef]
-                    except (KeyError, AttributeError):
-                        print " -- Error: State is missing"
-                        species_with_error.append(id)
-                        continue
+    ##********************************************************************
+    def get_names(self):
+        """
+        Returns the names (PF_Name) of all entries in the database.
 
-                    if id in result.data['Atoms'].keys():
-                        is_atom = True
-                        is_molecule = False
-                        atomname = self.createatomname(result.data['Atoms'][id])
-                    elif id in result.data['Molecules'].keys():
-                        is_atom = False
-                        is_molecule = True
-                        formula = str(result.data['Molecules'][id].OrdinaryStructuralFormula)
-
-                        # Get string which identifies the vibrational states involved in the transition
-                        t_state = self.getvibstatelabel(upper_state, lower_state)
-                        
-                    else:
-                        continue
-                                                
-                    # Get hyperfinestructure info if hfsInfo is None
-                    # only then the hfsInfo has not been inserted in the species name
-                    # (there can be multiple values in the complete dataset
-                    t_hfs = ''
-                    try:
-                        for pc in result.data['RadiativeTransitions'][trans].ProcessClass:
-                            if str(pc)[:3] == 'hyp':
-                                t_hfs = str(pc)
-                    except Exception as e:
-                            print("Error: %s" % str(e))
+        :rtype: set
+        """
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT PF_Name FROM Partitionfunctions")
+        return set([row[0] for row in cursor])
 
-                    frequency = float(result.data['RadiativeTransitions'][trans].FrequencyValue)
-                    try:
-                        uncertainty = "%lf" % float(result.data['RadiativeTransitions'][trans].FrequencyAccuracy)
-                    except TypeError:
-                        print " -- Error uncertainty not available"
-                        species_with_error.append(id)
-                        continue
+    ##********************************************************************
+    def insert_result_data(self, cursor, result, speciesid, node, names_black_list, update=False):
+        """
+        Inserts transitions and partition functions contained in the result of a request
+        into the local database. All statements are executed with the given cursor, so that
+        the caller controls the transaction.
+
+        :ivar sqlite3.Cursor cursor: cursor which is used for all statements
+        :ivar results.Result result: result of the request to the VAMDC node
+        :ivar str speciesid: only transitions of this specie are inserted (all if None)
+        :ivar nodes.Node node: vamdc-node from which the data has been retrieved
+        :ivar set names_black_list: names which must not be used for new entries. Names
+                                  of new entries are added to it.
+        :ivar boolean update:  if True then all entries in the local database with the same
+                               species-id will be deleted before the insert is performed.
+        """
+        num_transitions = {}
+        # will contain the set of names which belong to one specie
+        species_names = {}
+        # set will contain species whose insert failed
+        species_with_error = set()
+
+        transitions = result.data['RadiativeTransitions']
+        states = result.data['States']
+        atoms = result.data['Atoms']
+        molecules = result.data['Molecules']
+
+        #------------------------------------------------------------------------------------------------------
+        # if update is allowed then all entries in the database for the given species-id will be
+        # deleted, and thus replaced by the new data
+        if update:
+            if speciesid is None:
+                for sid in list(molecules) + list(atoms):
+                    names_black_list.difference_update(self.delete_species(sid, commit = False))
+            else:
+                names_black_list.difference_update(self.delete_species(speciesid, commit = False))
 
-                    # Get statistical weight if present
-                    try:
-                        weight = int(upper_state.TotalStatisticalWeight)
-                    except:
-                        print " -- Error statistical weight not available"
-                        species_with_error.append(id)
-                        continue
+        #------------------------------------------------------------------------------------------------------
+        
+        #------------------------------------------------------------------------------------------------------
+        # Insert all transitions
+
+        # atom names, formulas and vibrational state labels only depend on the specie and
+        # on the pair of states, which are shared by many transitions. They are created once.
+        atom_names = {}
+        formulas = {}
+        vibstate_labels = {}
+        # final name of each (specie, name) - pair and next counter to try for a stem of a name
+        resolved_names = {}
+        next_suffix = {}
+
+        # data might contain transitions for other species (if query is based on ichikey/vamdcspeciesid).
+        # Insert transitions only if they belong to the correct specie
+        if speciesid is None:
+            specie_transitions = transitions.values()
+        else:
+            specie_transitions = [transition for transition in transitions.values() if transition.SpeciesID == speciesid]
+
+        num_transitions_found = len(specie_transitions)
+        counter_transitions = 0
+        transition_rows = []
+        # species of the transitions in transition_rows
+        batch_species = set()
+
+        def flush_transitions():
+            """
+            Inserts the collected transitions. If the insert fails, none of them has been
+            inserted and the species of the transitions are treated as erroneous.
+            """
+            try:
+                self.insert_transitions(cursor, transition_rows)
+            except sqlite3.Error as e:
+                print("Transitions have not been inserted:\n Error: %s" % str(e))
+                species_with_error.update(batch_species)
+            del transition_rows[:]
+            batch_species.clear()
+
+        for transition in specie_transitions:
+            counter_transitions+=1
+            if LOGLEVEL == 'full' and (counter_transitions % PROGRESS_INTERVAL == 0 or counter_transitions == num_transitions_found):
+                print("\r insert transition %d of %d" % (counter_transitions, num_transitions_found))
+            id = str(transition.SpeciesID)
+            # if an error has occured already then there will be no further insert
+            if id in species_with_error:
+                continue
 
-                    # Get nuclear spin isomer (ortho/para) if present
-                    try:
-                        nsiName = upper_state.NuclearSpinIsomerName
-                    except AttributeError:
-                        nsiName = None
-
-                    # if nuclear spin isomer is defined then two entries have to be generated
-                    if nsiName is not None and nsiName != '':
-                        nsinames = [nsiName, None]
-                        nsiStateOrigin = result.data['States']["%s" % upper_state.NuclearSpinIsomerLowestEnergy]
-                        nsiEnergyOffset = float(nsiStateOrigin.StateEnergyValue)
-                    else:
-                        nsinames = [None]
-
-                    for nsiName in nsinames:
-                        # create name
-                        if is_atom == True:
-                            t_name = atomname
-                        else:
-                            t_affix = ";".join([affix for affix in [t_hfs, nsiName] if affix is not None and affix!=''])
-                            t_name = "%s;%s;%s" % (formula, t_state, t_affix)
-                        t_name = t_name.strip()
-                        # remove all blanks in the name
-                        t_name = t_name.replace(' ','')
-                        # check if name is in the list of forbidden names and add counter if so
-                        i = 1
+            # Get upper and lower state from the states table
+            try:
+                upper_state = states[transition.UpperStateRef]
+                lower_state = states[transition.LowerStateRef]
+            except (KeyError, AttributeError):
+                print " -- Error: State is missing"
+                species_with_error.add(id)
+                continue
+
+            if id in atoms:
+                is_atom = True
+                is_molecule = False
+                atomname = atom_names.get(id)
+                if atomname is None:
+                    atomname = atom_names[id] = self.createatomname(atoms[id])
+            elif id in molecules:
+                is_atom = False
+                is_molecule = True
+                formula = formulas.get(id)
+                if formula is None:
+                    formula = formulas[id] = str(molecules[id].OrdinaryStructuralFormula)
+
+                # Get string which identifies the vibrational states involved in the transition
+                state_refs = (transition.UpperStateRef, transition.LowerStateRef)
+                t_state = vibstate_labels.get(state_refs)
+                if t_state is None:
+                    t_state = vibstate_labels[state_refs] = self.getvibstatelabel(upper_state, lower_state)
+                    
+            else:
+                continue
+                                            
+            # Get hyperfinestructure info if hfsInfo is None
+            # only then the hfsInfo has not been inserted in the species name
+            # (there can be multiple values in the complete dataset
+            t_hfs = ''
+            try:
+                for pc in transition.ProcessClass:
+                    pc = str(pc)
+                    if pc.startswith('hyp'):
+                        t_hfs = pc
+            except Exception as e:
+                    print("Error: %s" % str(e))
+
+            frequency = float(transition.FrequencyValue)
+            try:
+                uncertainty = float(transition.FrequencyAccuracy)
+            except TypeError:
+                print " -- Error uncertainty not available"
+                species_with_error.add(id)
+                continue
+
+            # Get statistical weight if present
+            try:
+                weight = int(upper_state.TotalStatisticalWeight)
+            except:
+                print " -- Error statistical weight not available"
+                species_with_error.add(id)
+                continue
+
+            # Get nuclear spin isomer (ortho/para) if present
+            try:
+                nsiName = upper_state.NuclearSpinIsomerName
+            except AttributeError:
+                nsiName = None
+
+            # if nuclear spin isomer is defined then two entries have to be generated
+            if nsiName is not None and nsiName != '':
+                nsinames = [nsiName, None]
+                nsiStateOrigin = states[upper_state.NuclearSpinIsomerLowestEnergy]
+                nsiEnergyOffset = float(nsiStateOrigin.StateEnergyValue)
+            else:
+                nsinames = [None]
+
+            for nsiName in nsinames:
+                # create name
+                if is_atom == True:
+                    t_name = atomname
+                else:
+                    t_affix = ";".join([affix for affix in (t_hfs, nsiName) if affix])
+                    t_name = "%s;%s;%s" % (formula, t_state, t_affix)
+                t_name = t_name.strip()
+                # remove all blanks in the name
+                t_name = t_name.replace(' ','')
+                # Names which have been created for this specie already are reused. Otherwise
+                # check if name is in the set of forbidden names and add counter if so.
+                # The search for a free counter continues where it stopped for the same stem.
+                name_key = (id, t_name)
+                if name_key in resolved_names:
+                    t_name = resolved_names[name_key]
+                else:
+                    if t_name in names_black_list:
+                        stem = t_name.split('#')[0]
+                        i = next_suffix.get(stem, 1)
+                        t_name = "%s#%d" % (stem, i)
                         while t_name in names_black_list:
-                            t_name = "%s#%d" % (t_name.split('#')[0], i)
                             i += 1
-                        # update list of distinct species names.
-                        if id in species_names:
-                            if not t_name in species_names[id]:
-                                species_names[id].append(t_name)
-                                num_transitions[t_name] = 0
-                        else:
-                            species_names[id] = [t_name]
-                            num_transitions[t_name] = 0
-
-                        if nsiName is not None:
-                            lowerStateEnergy = float(lower_state.StateEnergyValue) - nsiEnergyOffset
-                        else:
-                            lowerStateEnergy = float(lower_state.StateEnergyValue)
-                            
+                            t_name = "%s#%d" % (stem, i)
+                        next_suffix[stem] = i + 1
+                    resolved_names[name_key] = t_name
+                    # update set of distinct species names.
+                    species_names.setdefault(id, set()).add(t_name)
+                    num_transitions[t_name] = 0
+                    names_black_list.add(t_name)
+
+                if nsiName is not None:
+                    lowerStateEnergy = float(lower_state.StateEnergyValue) - nsiEnergyOffset
+                else:
+                    lowerStateEnergy = float(lower_state.StateEnergyValue)
                         
-                        # Insert transition into database
-                        try:
-                            cursor.execute("""INSERT INTO Transitions (
-                            T_Name,
-                            T_Frequency,
-                            T_EinsteinA,
-                            T_Uncertainty,
-                            T_EnergyLower,
-                            T_UpperStateDegeneracy,
-                            T_HFS,
-                            T_UpperStateQuantumNumbers,
-                            T_LowerStateQuantumNumbers) VALUES
-                            (?, ?,?,?,?, ?,?, ?,?)""",
-                                           (t_name,
-                                            "%lf" % frequency,
-                                            "%g" % float(result.data['RadiativeTransitions'][trans].TransitionProbabilityA),
-                                            uncertainty, "%lf" % lowerStateEnergy,
+                    
+                # Collect transition for the insert into the database
+                try:
+                    transition_rows.append((t_name,
+                                            frequency,
+                                            float(transition.TransitionProbabilityA),
+                                            uncertainty,
+                                            lowerStateEnergy,
                                             weight,
                                             #upper_state.QuantumNumbers.case,
                                             t_hfs,
                                             str(upper_state.QuantumNumbers.qn_string),
                                             str(lower_state.QuantumNumbers.qn_string),
                                             ))
-                            num_transitions[t_name] += 1
-                        except Exception as e:
-                            print("Transition has not been inserted:\n Error: %s" % str(e))
-            print "\n"
-            #------------------------------------------------------------------------------------------------------
-
-            #------------------------------------------------------------------------------------------------------
-            # delete transitions for all entries where an error occured during the insert
-            for id in species_with_error:
-                print " -- Species {id} has not been inserted due to an error ".format(id=str(id))
+                    num_transitions[t_name] += 1
+                    batch_species.add(id)
+                except Exception as e:
+                    print("Transition has not been inserted:\n Error: %s" % str(e))
+
+                if len(transition_rows) >= INSERT_BATCH_SIZE:
+                    flush_transitions()
+
+        # insert remaining transitions
+        flush_transitions()
+        print "\n"
+        #------------------------------------------------------------------------------------------------------
+
+        #------------------------------------------------------------------------------------------------------
+        # delete transitions for all entries where an error occured during the insert
+        for id in species_with_error:
+            print " -- Species {id} has not been inserted due to an error ".format(id=str(id))
+            try:
+                names = [str(name) for name in species_names[id]]
+                self.delete_transitions(cursor, names)
+                for name in names:
+                    print " --    {name} ".format(name=name)
+                    num_transitions.pop(name, None)
+            except KeyError:
+                # no name has been created for the specie before the error occured
+                pass
+
+        #------------------------------------------------------------------------------------------------------
+        # insert specie in Partitionfunctions (header) table
+        if node:
+            resourceID = node.identifier
+            url = node.url
+        else:
+            resourceID = 'NULL'
+            url = 'NULL'
+
+        # all rows of this insert share one timestamp and the prefix of the url
+        timestamp = datetime.now()
+        url_prefix = "%ssync?LANG=VSS2&amp;REQUEST=doQuery&amp;FORMAT=XSAMS&amp;QUERY=Select+*+where+SpeciesID%%3D" % url
+
+        # rows are collected and inserted with one executemany per table layout
+        pf_atom_rows = []
+        pf_molecule_rows = []
+
+        # Insert molecules
+        for id in species_names:
+            if id in species_with_error:
+                continue
+            # attributes which are shared by all entries of the specie
+            try:
+                if id in atoms:
+                    specie = atoms[id]
+                else:
+                    specie = molecules[id]
+                vamdcspeciesid = specie.VAMDCSpeciesID
+            except Exception as e:
+                print("An error occurred: %s" % str(e))
+                print(molecules.keys())
+                continue
+            comment = getattr(specie, 'Comment', "")
+            specie_url = url_prefix + id
+
+            for name in species_names[id]:
+                # determine hyperfine-structure affix and nuclear spin isomer affix
                 try:
-                    for name in species_names[id]:
-                        cursor.execute("DELETE FROM Transitions WHERE T_Name=?", (str(name),))
-                        print " --    {name} ".format(name=str(name))
+                    hfs = ''
+                    nsi = ''
+                    for affix in name.split("#")[0].split(';',2)[2].split(";"):
+                        if affix.strip()[:3] == 'hyp':
+                            hfs = affix.strip()
+                        else:
+                            # if affix does not identify hyperfine structure
+                            # it identifies the nuclear spin isomer
+                            nsi = affix.strip()
                 except:
-                    pass
+                    hfs = ''
+
+                # Collect row for partitionfunctions
+                if id in atoms:
+                    pf_atom_rows.append((name,
+                                         id,
+                                         vamdcspeciesid,
+                                         comment,
+                                         resourceID,
+                                         specie_url,
+                                         timestamp, ))
+                else:
+                    pf_molecule_rows.append((name,
+                                             id,
+                                             vamdcspeciesid,
+                                             hfs,
+                                             nsi,
+                                             comment,
+                                             resourceID,
+                                             specie_url,
+                                             timestamp, ))
+
+        # Insert rows in partitionfunctions (header)
+        try:
+            cursor.executemany(SQL_INSERT_PF_ATOM, pf_atom_rows)
+            cursor.executemany(SQL_INSERT_PF_MOLECULE, pf_molecule_rows)
+        except sqlite3.Error as e:
+            print("An error occurred: %s" % str(e))
+
+        # Update Partitionfunctions. The partition functions of atoms are calculated
+        # from the states of all atoms at once when the first one is needed.
+        # Parameters are collected per statement and executed with one executemany each.
+        atom_pfs = None
+        pf_atom_updates = []
+        pf_nsi_updates = {}
+        for id in species_names:
+            if id in species_with_error:
+                continue
 
-            #------------------------------------------------------------------------------------------------------
-            # insert specie in Partitionfunctions (header) table
-            if node:
-                resourceID = node.identifier
-                url = node.url
+            if id in atoms:
+                try:
+                    if atom_pfs is None:
+                        atom_pfs = specmodel.calculate_partitionfunctions(states, TEMPERATURE_ARRAY)
+                    pf_atom_updates.append(atom_pfs[id].tolist() + [id])
+                except Exception as e:
+                    print("Partition function of %s could not be calculated" % id)
+                    print("Error: %s" % str(e))
             else:
-                resourceID = 'NULL'
-                url = 'NULL'
-                
+                try:
+                    for pfs in getattr(molecules[id], 'PartitionFunction', []):
+                        if 'NuclearSpinIsomer' not in vars(pfs):
+                            nsi = ''
+                        else:
+                            nsi = pfs.NuclearSpinIsomer  
+                        values = {}
+                        for temperature in pfs.values:
+                            index = TEMPERATURE_INDEX.get(float(temperature))
+                            if index is None:
+                                print("Partition function is not stored for temperature %s" % str(temperature))
+                                continue
+                            values[index] = pfs.values[temperature]
+                        if values:
+                            # all temperatures of one nuclear spin isomer are updated with one statement.
+                            # Entries which provide the same temperatures share the statement.
+                            indexes = tuple(sorted(values))
+                            pf_nsi_updates.setdefault(indexes, []).append([values[index] for index in indexes] + [id, nsi])
+                except Exception as e:
+                    print("Partition function of %s could not be processed" % id)
+                    print("Error: %s" % str(e))
 
-            # Insert molecules
-            for id in species_names:
-                if id in species_with_error:
-                    continue
-                for name in species_names[id]:
-                    # determine hyperfine-structure affix and nuclear spin isomer affix
-                    try:
-                        hfs = ''
-                        nsi = ''
-                        for affix in name.split("#")[0].split(';',2)[2].split(";"):
-                            if affix.strip()[:3] == 'hyp':
-                                hfs = affix.strip()
-                            else:
-                                # if affix does not identify hyperfine structure
-                                # it identifies the nuclear spin isomer
-                                nsi = affix.strip()
-                    except:
-                        hfs = ''
+        try:
+            cursor.executemany(SQL_UPDATE_PF_ALL_TEMPERATURES, pf_atom_updates)
+        except sqlite3.Error as e:
+            print("SQL-Error: %s " % SQL_UPDATE_PF_ALL_TEMPERATURES)
+            print("Error: %s" % str(e))
+        for indexes in pf_nsi_updates:
+            sql = get_pf_update_statement(indexes)
+            try:
+                cursor.executemany(sql, pf_nsi_updates[indexes])
+            except sqlite3.Error as e:
+                print("SQL-Error: %s " % sql)
+                print("Error: %s" % str(e))
+        #------------------------------------------------------------------------------------------------------
 
-                    # Insert row in partitionfunctions
-                    try:
-                        if id in result.data['Atoms']:
-                            if not result.data['Atoms'][id].__dict__.has_key('Comment'):
-                                result.data['Atoms'][id].Comment = ""
-                            cursor.execute("INSERT INTO Partitionfunctions (PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_Comment, PF_ResourceID, PF_URL, PF_Timestamp) VALUES (?,?,?,?,?,?,?)",
-                                           ("%s" % name,
-                                            id,
-                                            "%s" % (result.data['Atoms'][id].VAMDCSpeciesID),
-                                            "%s" % (result.data['Atoms'][id].Comment),
-                                            resourceID,
-                                            "%s%s%s" % (url, "sync?LANG=VSS2&amp;REQUEST=doQuery&amp;FORMAT=XSAMS&amp;QUERY=Select+*+where+SpeciesID%3D", id),
-                                            datetime.now(), ))
-                        else:
-                            cursor.execute("INSERT INTO Partitionfunctions (PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_HFS, PF_NuclearSpinIsomer, PF_Comment, PF_ResourceID, PF_URL, PF_Timestamp) VALUES (?,?,?,?,?,?,?,?,?)",
-                                           ("%s" % name,
-                                            id,
-                                            "%s" % (result.data['Molecules'][id].VAMDCSpeciesID),
-                                            hfs,
-                                            nsi, 
-                                            "%s" % (result.data['Molecules'][id].Comment),
-                                            resourceID,
-                                            "%s%s%s" % (url, "sync?LANG=VSS2&amp;REQUEST=doQuery&amp;FORMAT=XSAMS&amp;QUERY=Select+*+where+SpeciesID%3D", id),
-                                            datetime.now(), ))
-                    except sqlite3.Error as e:
-                        print("An error occurred: %s" % str(e))
-                    except Exception as e:
-                        print("An error occurred: %s" % str(e))
-                        print(result.data['Molecules'].keys())
-
-                # Update Partitionfunctions
-                if id in result.data['Atoms'].keys():
-                    for temperature in Temperatures:
-                        pf_values = specmodel.calculate_partitionfunction(result.data['States'], temperature = temperature)
-                        try:
-                            field = ("PF_%.3lf" % float(temperature)).replace('.', '_')
-                            sql = "UPDATE Partitionfunctions SET %s=? WHERE PF_SpeciesID=? " % field
-                            cursor.execute(sql, (pf_values[id], id))
-                        except Exception as e:
-                            print("SQL-Error: %s " % sql)
-                            print(pf_value, id)
-                            print("Error: %s" % str(e))
-                else:
-                    try:
-                        for pfs in result.data['Molecules'][id].PartitionFunction:
-                            if not pfs.__dict__.has_key('NuclearSpinIsomer'):
-                                nsi = ''
-                            else:
-                                nsi = pfs.NuclearSpinIsomer  
-                            for temperature in pfs.values.keys():
-
-                                try:
-                                    field = ("PF_%.3lf" % float(temperature)).replace('.', '_')
-                                    sql = "UPDATE Partitionfunctions SET %s=? WHERE PF_SpeciesID=? AND IFNULL(PF_NuclearSpinIsomer,'')=?" % field
-                                    cursor.execute(sql, (pfs.values[temperature], id, nsi))
-                                except Exception as e:
-                                    print("SQL-Error: %s " % sql)
-                                    print(pfs.values[temperature], id)
-                                    print("Error: %s" % str(e))
-                    except:
-                        pass
-            #------------------------------------------------------------------------------------------------------
-
-            for row in num_transitions:
-                print "      for %s inserted %d transitions" % (row, num_transitions[row])
-            self.conn.commit()
-            cursor.close()
+        for row in num_transitions:
+            print "      for %s inserted %d transitions" % (row, num_transitions[row])
 
     ##********************************************************************
-    def update_database(self, add_nodes = None, insert_only = False, update_only = False, delete_archived = False):
+    def insert_transitions(self, cursor, rows):
+        """
+        Inserts a list of transitions into the Transitions table. The insert is performed
+        with one executemany - call within the transaction of the cursor. Errors are raised
+        to the caller, because none of the rows has been inserted then.
+
+        :ivar sqlite3.Cursor cursor: cursor which is used for the insert
+        :ivar list rows: list of tuples (T_Name, T_Frequency, T_EinsteinA, T_Uncertainty,
+                         T_EnergyLower, T_UpperStateDegeneracy, T_HFS,
+                         T_UpperStateQuantumNumbers, T_LowerStateQuantumNumbers)
+        """
+        if len(rows) == 0:
+            return
+        cursor.executemany(SQL_INSERT_TRANSITION, rows)
+
+    ##********************************************************************
+    def delete_transitions(self, cursor, names):
+        """
+        Deletes all transitions of the given entries (names). The transitions are deleted
+        with one statement per MAX_IN_LIST_SIZE names.
+
+        :ivar sqlite3.Cursor cursor: cursor which is used for the delete
+        :ivar list names: list of names (T_Name) whose transitions will be deleted
+        """
+        for i in range(0, len(names), MAX_IN_LIST_SIZE):
+            chunk = names[i:i + MAX_IN_LIST_SIZE]
+            cursor.execute("DELETE FROM Transitions WHERE T_Name IN (%s)" % ",".join("?" * len(chunk)), chunk)
+
+    ##********************************************************************
+    def update_database(self, add_nodes = None, insert_only = False, update_only = False, delete_archived = False, quiet = False):
         """
         Checks if there are updates available for all entries. Updates will
         be retrieved from the resource specified in the database.
@@ -705,15 +994,24 @@ class Database(object):
         :ivar nodes.Node add_nodes: Single or List of node-instances.
         :ivar boolean insert_only: Just insert new species and skip updates if True
         :ivar boolean update_only: Just updates species and skip inserts if True
+        :ivar boolean delete_archived: Delete entries which have been archived by the node if True
+        :ivar boolean quiet: Report only entries which are updated or could not be checked if True.
+                             Otherwise the result of the check is reported for each entry.
         """
+        import nodes
+
         # counter to identify which entry is currently processed
         counter = 0
         # counter to count available updates
         count_updates = 0
-        # list of database - nodes which are currently in the local database
+        # list of database - nodes which are currently in the local database and
+        # the same nodes as set for membership tests
         dbnodes = []
+        dbnodes_set = set()
         # create an instance with all available vamdc-nodes
         nl = nodes.Nodelist()
+        # nodes by their ivo-identifier (the first node wins like in Nodelist.getnode)
+        node_by_id = dict([(node.identifier, node) for node in reversed(nl.nodes)])
 
         # attach additional nodes to the list of dbnodes (for insert)
         if not functions.isiterable(add_nodes):
@@ -723,17 +1021,18 @@ class Database(object):
                 pass
             elif not isinstance(node, nodes.Node):
                 print "Could not attach node. Wrong type, it should be type <nodes.Node>"
-            else:
+            elif node not in dbnodes_set:
                 dbnodes.append(node)
+                dbnodes_set.add(node)
         
+        # databases which have been created with an older layout or whose initial fill
+        # has been aborted lack some indexes
+        self.create_indexes()
+
         #--------------------------------------------------------------------
         # Check if updates are available for entries
 
-        # Get list of species in the database
         cursor = self.conn.cursor()
-        cursor.execute("SELECT PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, datetime(PF_Timestamp), PF_ResourceID FROM Partitionfunctions ")
-        rows = cursor.fetchall()
-        num_rows = len(rows)
         query = q.Query()
         request = r.Request()
 
@@ -742,98 +1041,152 @@ class Database(object):
             print "Looking for updates"
             print("----------------------------------------------------------")
 
-            for row in rows:
-                counter += 1
-                print "%5d/%5d: Check specie %-55s (%-15s): " % (counter, num_rows, row[0], row[1]),
-                try:
-                    node = nl.getnode(str(row[4]))
-                except:
-                    node = None
-                if node is None:
-                    print " -- RESOURCE NOT AVAILABLE"
-                    continue
-                else:
-                    if node not in dbnodes:
-                        dbnodes.append(node)
-
-                vamdcspeciesid = row[2]
+            # Entries of the same specie (e.g. different vibrational states) are checked and
+            # updated together, because the update replaces all entries of the specie.
+            # The entries are grouped while they are read from the database.
+            species_keys = []
+            species_entries = {}
+            cursor.execute("SELECT PF_Name, PF_SpeciesID, datetime(PF_Timestamp), PF_ResourceID FROM Partitionfunctions ")
+            for row in cursor:
+                name, speciesid, timestamp, resourceid = row
+                key = (resourceid, speciesid)
+                if key not in species_entries:
+                    species_keys.append(key)
+                    species_entries[key] = []
+                species_entries[key].append(row)
+            num_species = len(species_keys)
+
+            # Resolve the node of each specie. The requests for the 'last-modified' date are
+            # independent of each other and are sent in parallel; their results are processed
+            # in the order of the species.
+            targets = []
+            for resourceid, pf_speciesid in species_keys:
+                node = node_by_id.get(str(resourceid))
+                if node is not None and node not in dbnodes_set:
+                    dbnodes.append(node)
+                    dbnodes_set.add(node)
                 # Currently the database prefix XCDMS- or XJPL- has to be removed
-                speciesid = row[1].split("-")[1]
-                query_string = "SELECT ALL WHERE SpeciesID=%s" % speciesid
-                request.setnode(node)
-                request.setquery(query_string)
+                targets.append((node, pf_speciesid.split("-")[1]))
 
-                errorcode = None
-                try:
-                    changedate = request.getlastmodified()
-                except r.NoContentError as e:
-                    # Delete entries which are not available anymore
-                    if request.status == 204:
-                        if delete_archived:
-                            print " -- ENTRY ARCHIVED AND WILL BE DELETED -- "
-                            del_specie = self.delete_species(row[1])
-                            if len(del_specie) > 0:
-                                print "\r Done"
-                        else:
-                            print " -- ENTRY ARCHIVED -- "
-                        continue
+            # species which will be updated per node, in the order of the nodes
+            pending_updates = {}
+            pending_nodes = []
 
-                except r.TimeOutError as e:
-#                    errorcode = e.strerror
-#                    changedate = None
-                    print " -- TIMEOUT: Could not check entry -- "
-                    continue
+            pool = ThreadPool(NUM_REQUEST_THREADS)
+            probes = pool.imap(request_lastmodified, [(node, "SELECT ALL WHERE SpeciesID=%s" % speciesid)
+                                                      for node, speciesid in targets if node is not None])
 
-                except:
-                    changedate = None
-                    print "Could not retrieve information - Unexpected error:", sys.exc_info()[0]
-                    continue
+            def report(message):
+                """
+                Prints the result of the check of the current specie.
+                """
+                print "%5d/%5d: Check specie %-55s (%-15s): " % (counter, num_species, ", ".join([entry[0] for entry in entries]), pf_speciesid), message
 
-                tstamp = parser.parse(row[3] + " GMT")
-                if changedate is None:
-                    if errorcode is None:
-                        errorcode = "UNKNOWN"
-                    print " -- %s (Could not retrieve information)" % errorcode
-                    continue
-                if tstamp < changedate:
-                    print " -- UPDATE AVAILABLE "
-                    count_updates += 1
-                    print " -- PERFORM UPDATE -- "
-                    query_string = "SELECT SPECIES WHERE SpeciesID=%s" % speciesid
-                    request.setquery(query_string)
+            try:
+                for key, (node, speciesid) in zip(species_keys, targets):
+                    entries = species_entries[key]
+                    pf_speciesid = key[1]
+                    counter += 1
+                    if quiet and counter % PROGRESS_INTERVAL == 0:
+                        print "%5d/%5d species checked" % (counter, num_species)
+                    if node is None:
+                        report(" -- RESOURCE NOT AVAILABLE")
+                        continue
 
-                    result = request.dorequest()
-                    try:
-                        result.populate_model()
-                    except:
-                        print " Error: Could not process data "
+                    request, changedate, error, reason = probes.next()
+
+                    errorcode = None
+                    if isinstance(error, r.NoContentError):
+                        # Delete entries which are not available anymore
+                        if request.status == 204:
+                            if delete_archived:
+                                report(" -- ENTRY ARCHIVED AND WILL BE DELETED -- ")
+                                del_specie = self.delete_species(pf_speciesid)
+                                if len(del_specie) > 0:
+                                    print "\r Done"
+                            else:
+                                report(" -- ENTRY ARCHIVED -- ")
+                            continue
+                        changedate = None
+                        errorcode = "NO CONTENT (%s)" % str(request.status)
+                    elif isinstance(error, r.TimeOutError):
+                        report(" -- TIMEOUT: Could not check entry -- ")
+                        continue
+                    elif error is not None:
+                        report("Could not retrieve information - Unexpected error: %s" % type(error))
                         continue
+
+                    # the oldest entry of the specie decides if an update is available
+                    tstamp = min([parse_timestamp(entry[2]) for entry in entries])
+                    if changedate is None:
+                        if errorcode is None:
+                            errorcode = "UNKNOWN"
+                        report(" -- %s (%s)" % (errorcode, reason or "Could not retrieve information"))
+                        continue
+                    if tstamp < changedate:
+                        report(" -- UPDATE AVAILABLE ")
+                        # the header which has been retrieved with the 'last-modified' date tells
+                        # if the node returns any data for the entry.
+                        if request.getcount('species') == 0:
+                            print " -- NO DATA AVAILABLE -- "
+                            continue
+                        count_updates += 1
+                        print " -- PERFORM UPDATE -- "
+                        query_string = "SELECT SPECIES WHERE SpeciesID=%s" % speciesid
+                        request.setquery(query_string)
+
+                        # the model of the result is populated by dorequest already
+                        try:
+                            result = request.dorequest()
+                        except Exception:
+                            result = None
+                        if result is None or not hasattr(result, 'data'):
+                            print " Error: Could not process data "
+                            continue
+                        if node not in pending_updates:
+                            pending_updates[node] = []
+                            pending_nodes.append(node)
+                        pending_updates[node].append((pf_speciesid, result.data['Molecules']))
+                        print " -- UPDATE SCHEDULED -- "
+                    elif not quiet:
+                        report(" -- up to date")
+            finally:
+                # the remaining requests are not sent if the loop has been left early
+                pool.terminate()
+                pool.join()
+
+            # The names of the entries in the database are read once for all updates and
+            # kept up to date by insert_species_data. Each specie is replaced in its own
+            # transaction, so that a failed update does not affect the other species.
+            count_failed = 0
+            names_black_list = self.get_names()
+            for node in pending_nodes:
+                print "Perform updates from '%s'" % node.name
+                for pf_speciesid, molecules in pending_updates[node]:
                     try:
-                        self.insert_species_data(result.data['Molecules'], node, update = True)
-                    except:
-                        print " Error: Could not update data "
+                        self.insert_species_data(molecules, node, update = True, names_black_list = names_black_list)
+                    except Exception:
+                        print " Error: Could not update data of %s " % pf_speciesid
+                        count_failed += 1
                         continue
-                    print " -- UPDATE DONE    -- "
-                else:
-                    print " -- up to date"
+                    print " -- UPDATE DONE    -- %s" % pf_speciesid
 
             if count_updates == 0:
                 print "\r No updates for your entries available"
+            elif count_failed > 0:
+                print "%d of %d updates failed" % (count_failed, count_updates)
             print "Done"
         else:
             cursor.execute("SELECT distinct PF_ResourceID FROM Partitionfunctions ")
-            rows = cursor.fetchall()
-            for row in rows:
-                try:
-                    node = nl.getnode(str(row[0]))
-                except:
-                    node = None
+            for row in cursor:
+                node = node_by_id.get(str(row[0]))
                 if node is None:
                     print " -- RESOURCE NOT AVAILABLE"
                     continue
                 else:
-                    if node not in dbnodes:
+                    if node not in dbnodes_set:
                         dbnodes.append(node)
+                        dbnodes_set.add(node)
 
 
         if update_only:
@@ -843,32 +1196,41 @@ class Database(object):
 
         #---------------------------------------------------------
         # Check all dbnodes for new species
-        for node in dbnodes:
-            counter = 0
-            insert_molecules_list = []
-            print("----------------------------------------------------------")
-            print "Query '{dbname}' for new species ".format(dbname=node.name)
-            print("----------------------------------------------------------")
-            request.setnode(node)
-            result = request.getspecies()
-            for id in result.data['Molecules']:
-                try:
-                    cursor.execute("SELECT PF_Name, PF_SpeciesID, PF_VamdcSpeciesID, PF_Timestamp FROM Partitionfunctions WHERE PF_SpeciesID=?", [(id)])
-                    exist = cursor.fetchone()
-                    if exist is None:
+
+        # species-ids which are already stored in the database
+        cursor.execute("SELECT DISTINCT PF_SpeciesID FROM Partitionfunctions")
+        existing_ids = set([row[0] for row in cursor.fetchall()])
+
+        # If the database is filled initially, the indexes on the transitions are built
+        # once after all species have been inserted.
+        bulk_import = len(existing_ids) == 0
+        if bulk_import:
+            self.prepare_for_bulk_import()
+
+        try:
+            for node in dbnodes:
+                counter = 0
+                insert_molecules_list = []
+                print("----------------------------------------------------------")
+                print "Query '{dbname}' for new species ".format(dbname=node.name)
+                print("----------------------------------------------------------")
+                request.setnode(node)
+                result = request.getspecies()
+                for id in result.data['Molecules']:
+                    if id not in existing_ids:
                         print "   %s" % result.data['Molecules'][id]
                         insert_molecules_list.append(result.data['Molecules'][id])
                         counter += 1
-                except Exception as e:
-                    print("Error: %s" % str(e))
-                    print(id)
-            print("There are %d new species available" % counter)
-            print("----------------------------------------------------------")
-            print("Start insert")
-            print("----------------------------------------------------------")           
-            self.insert_species_data(insert_molecules_list, node)
-            print("----------------------------------------------------------")           
-            print("Done")
+                print("There are %d new species available" % counter)
+                print("----------------------------------------------------------")
+                print("Start insert")
+                print("----------------------------------------------------------")           
+                self.insert_species_data(insert_molecules_list, node)
+                print("----------------------------------------------------------")           
+                print("Done")
+        finally:
+            if bulk_import:
+                self.finalize_bulk_import()
 
     ##********************************************************************
     def getvibstatelabel(self, upper_state, lower_state):
@@ -885,35 +1247,27 @@ class Database(object):
         if upper_state.QuantumNumbers.vibstate == lower_state.QuantumNumbers.vibstate:
             t_state = str(upper_state.QuantumNumbers.vibstate).strip()
         else:
+            qn_up = upper_state.QuantumNumbers.qn_dict
+            qn_low = lower_state.QuantumNumbers.qn_dict
+            # The labels are kept in the order in which a dict of the labels iterates them.
+            # Names of entries in existing databases are based on this order; sorting them
+            # would rename these entries on their next update.
             v_dict = {}
-            for label in list(set(upper_state.QuantumNumbers.qn_dict.keys() + lower_state.QuantumNumbers.qn_dict.keys())):
+            for label in set(qn_up.keys() + qn_low.keys()):
                 if specmodel.isVibrationalStateLabel(label):
-                    try:
-                        value_up = upper_state.QuantumNumbers.qn_dict[label]
-                    except:
-                        value_up = 0
-                    try:
-                        value_low = lower_state.QuantumNumbers.qn_dict[label]
-                    except:
-                        value_low = 0
-                    v_dict[label] = [value_up, value_low]
-            v_string = ''
-            valup_string = ''
-            vallow_string = ''
-            for v in v_dict:
-                v_string += "%s," % v
-                valup_string += "%s," % v_dict[v][0]
-                vallow_string += "%s," % v_dict[v][1]
+                    v_dict[label] = None
+            labels = list(v_dict)
+            v_string = ",".join(labels)
+            valup_string = ",".join(["%s" % qn_up.get(label, 0) for label in labels])
+            vallow_string = ",".join(["%s" % qn_low.get(label, 0) for label in labels])
             # do not distinct between upper and lower state
             # create just one label for both cases
             if valup_string < vallow_string:
-                dummy = vallow_string
-                vallow_string = valup_string
-                valup_string = dummy
-            if len(v_dict) > 1:
-                t_state = "(%s)=(%s)-(%s)" % (v_string[:-1], valup_string[:-1], vallow_string[:-1])
+                valup_string, vallow_string = vallow_string, valup_string
+            if len(labels) > 1:
+                t_state = "(%s)=(%s)-(%s)" % (v_string, valup_string, vallow_string)
             else:
-                t_state = "%s=%s-%s" % (v_string[:-1], valup_string[:-1], vallow_string[:-1])
+                t_state = "%s=%s-%s" % (v_string, valup_string, vallow_string)
 
             #t_state = '(%s)-(%s)' % (upper_state.QuantumNumbers.vibstate,lower_state.QuantumNumbers.vibstate)
 
@@ -931,12 +1285,8 @@ class Database(object):
         :rtype: str
         """
 
-        try:
-            charge = int(atom.IonCharge)
-        except AttributeError:
-            charge = 0
-
-        symbol = atom.ChemicalElementSymbol
+        charge = int(getattr(atom, 'IonCharge', 0))
+        massnumber = getattr(atom, 'MassNumber', '')
 
         if charge == 0:
             charge_str = ''
@@ -947,11 +1297,6 @@ class Database(object):
         else:
             charge_str = str(charge)
 
-        try:
-            massnumber = atom.MassNumber
-        except AttributeError:
-            massnumber = ''
-
         return "%s%s%s" % (massnumber, atom.ChemicalElementSymbol, charge_str)
 
     def update_splat_info(self):
@@ -973,6 +1318,7 @@ class Database(object):
         # update all entries where splat info is missing in the db.
         # does not update existing data
         cursor = self.conn.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
         sql = "UPDATE Partitionfunctions SET PF_SPLAT_ID=?, PF_SPLAT_NAME=?  WHERE PF_SPLAT_ID IS NULL \
                 AND CAST(TRIM(SUBSTR(PF_Comment,1,INSTR(PF_Comment,'-')-1)) AS INTEGER) = ?"
 
@@ -12,6 +12,7 @@ except ImportError:
  
 from xml.etree import ElementTree
 import urllib2
+import threading
 
 from settings import *
 import query as q
@@ -34,6 +35,50 @@ class NoContentError(Exception):
     def __init__(self, expr):
         self.expr = expr
         self.msg = "No content to perform operation on"
+
+# Connections to the database nodes are kept open and are reused by subsequent requests
+# (HTTP keep-alive). httplib-connections must not be shared between threads, therefore
+# each thread keeps its own connections.
+_connections = threading.local()
+
+def getconnection(scheme, netloc, timeout = TIMEOUT):
+    """
+    Returns the connection of the current thread to the given host. The connection is
+    created if it does not exist yet.
+
+    :ivar str scheme: 'http' or 'https'
+    :ivar str netloc: host (and port) of the database node
+    :ivar float timeout: timeout of the connection in seconds
+    :rtype: httplib.HTTPConnection
+    """
+    try:
+        pool = _connections.pool
+    except AttributeError:
+        pool = _connections.pool = {}
+
+    conn = pool.get((scheme, netloc))
+    if conn is None:
+        if scheme == 'https':
+            conn = HTTPSConnection(netloc, timeout = timeout)
+        else:
+            conn = HTTPConnection(netloc, timeout = timeout)
+        pool[(scheme, netloc)] = conn
+    else:
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+    return conn
+
+def closeconnection(scheme, netloc):
+    """
+    Closes the connection of the current thread to the given host and removes it
+    from the connections which are reused.
+    """
+    try:
+        conn = _connections.pool.pop((scheme, netloc))
+    except (AttributeError, KeyError):
+        return
+    conn.close()
         
 class Request(object):
     """
@@ -119,6 +164,32 @@ class Request(object):
                                                                      urllib2.quote(self.query.Query))
         
 
+    def __getresponse(self, HttpMethod, timeout):
+        """
+        Sends the request with the given http-method to the database node and returns the response.
+        The connection to the node is reused if the current thread has sent a request to it before.
+        If the node has closed this connection in the meantime, the request is sent once more on a
+        new connection.
+        """
+        url = self.baseurl + self.querypath
+        urlobj = urlsplit(url)
+
+        for attempt in range(2):
+            conn = getconnection(urlobj.scheme, urlobj.netloc, timeout = timeout)
+            try:
+                conn.putrequest(HttpMethod, urlobj.path+"?"+urlobj.query)
+                conn.endheaders()
+                return conn.getresponse()
+            except socket.timeout:
+                closeconnection(urlobj.scheme, urlobj.netloc)
+                self.status = 408
+                self.reason = "Socket timeout"
+                raise TimeOutError
+            except (HTTPException, socket.error):
+                closeconnection(urlobj.scheme, urlobj.netloc)
+                if attempt > 0:
+                    raise
+
     def dorequest(self, timeout = TIMEOUT, HttpMethod = "POST", parsexsams = True):
         """
         Sends the request to the database node and returns a result.Result instance. The
@@ -129,31 +200,18 @@ class Request(object):
         """
         self.xml = None
         #self.get_xml(self.Source.Requesturl)
-        url = self.baseurl + self.querypath
-        urlobj = urlsplit(url)
-        
-        if urlobj.scheme == 'https':
-            conn = HTTPSConnection(urlobj.netloc, timeout = timeout)
-        else:
-            conn = HTTPConnection(urlobj.netloc, timeout = timeout)
-        conn.putrequest(HttpMethod, urlobj.path+"?"+urlobj.query)
-        conn.endheaders()
-        
-        try:
-            res = conn.getresponse()
-        except socket.timeout:
-            # error handling has to be included
-            self.status = 408
-            self.reason = "Socket timeout"
-            raise TimeOutError
+        res = self.__getresponse(HttpMethod, timeout)
 
         self.status = res.status
         self.reason = res.reason
 
+        # the body is read in any case, so that the connection can be reused
+        content = res.read()
+
         if not parsexsams:
             if res.status == 200:
                 result = r.Result()
-                result.Content = res.read()
+                result.Content = content
             elif res.status == 400 and HttpMethod == 'POST':
                 # Try to use http-method: GET
                 result = self.dorequest( HttpMethod = 'GET', parsexsams = parsexsams)
@@ -161,7 +219,7 @@ class Request(object):
                 result = None
         else:
             if res.status == 200:
-                self.xml = res.read()
+                self.xml = content
 
                 result = r.Result()
                 result.Xml = self.xml
@@ -174,30 +232,19 @@ class Request(object):
 
         return result
 
-    def doheadrequest(self, timeout = TIMEOUT):
+    def doheadrequest(self, timeout = TIMEOUT, verbose = True):
         """
         Sends a HEAD request to the database node. The header returned by the database node contains some
         information on statistics. This information is stored in the headers object of the request instance.
+
+        :ivar boolean verbose: print unexpected status codes if True. The status code is available in
+                               the attribute status in any case.
         """
 
         self.headers = {}
 
-        url = self.baseurl + self.querypath
-        urlobj = urlsplit(url)
-       
-        if urlobj.scheme == 'https':
-            conn = HTTPSConnection(urlobj.netloc, timeout = timeout)
-        else:
-            conn = HTTPConnection(urlobj.netloc, timeout = timeout)
-        conn.putrequest("HEAD", urlobj.path+"?"+urlobj.query)
-        conn.endheaders()
-        
-        try:
-            res = conn.getresponse()
-        except socket.timeout, e:
-            self.status = 408
-            self.reason = "Socket timeout"
-            raise TimeOutError
+        res = self.__getresponse("HEAD", timeout)
+        res.read()
 
         self.status = res.status
         self.reason = res.reason
@@ -214,7 +261,8 @@ class Request(object):
                             ("vamdc-count-radiative",0),
                             ("vamdc-count-atoms",0)]
         elif res.status == 408:
-            print "TIMEOUT"
+            if verbose:
+                print "TIMEOUT"
             headers =  [("vamdc-count-species",0),
                             ("vamdc-count-states",0),
                             ("vamdc-truncated",0),
@@ -224,7 +272,8 @@ class Request(object):
                             ("vamdc-count-radiative",0),
                             ("vamdc-count-atoms",0)]            
         else:
-            print "STATUS: %d" % res.status
+            if verbose:
+                print "STATUS: %d" % res.status
             headers =  [("vamdc-count-species",0),
                             ("vamdc-count-states",0),
                             ("vamdc-truncated",0),
@@ -237,20 +286,26 @@ class Request(object):
         for key,value in headers:
             self.headers[key] = value
  
-    def getlastmodified(self):
+    def getlastmodified(self, verbose = True):
         """
         Returns the 'last-modified' date which has been specified in the
-        Header of the requested document.
+        Header of the requested document. None is returned if the header does
+        not contain a valid date.
+
+        :ivar boolean verbose: print unexpected status codes and dates which could
+                               not be parsed if True.
         """
         if not self.status == 200:
-            self.doheadrequest()
+            self.doheadrequest(verbose = verbose)
 
         if self.headers.has_key('last-modified'):
             try:
                 self.lastmodified = parse(self.headers['last-modified'])
             except Exception, e:
-                print "Could not parse date %s" % self.headers['last-modified']
-                print e
+                if verbose:
+                    print "Could not parse date %s" % self.headers['last-modified']
+                    print e
+                self.lastmodified = None
         else:
             if self.status == 204:
                 raise NoContentError('requets.getlastmodified')
@@ -259,6 +314,20 @@ class Request(object):
 
         return self.lastmodified
 
+    def getcount(self, name):
+        """
+        Returns the number of items (e.g. 'species', 'states', 'radiative') which the database
+        node reports for the query in the header ('vamdc-count-<name>') of the requested
+        document. None is returned if the node does not report this number.
+        """
+        if not self.status == 200:
+            self.doheadrequest()
+
+        try:
+            return int(self.headers['vamdc-count-%s' % name])
+        except (KeyError, ValueError):
+            return None
+
     def getspecies(self):
         """
         Requests all species of the database node and returns a result.Result instance which contains the inforation
@@ -10,5 +10,20 @@ REGURL='http://registry.vamdc.eu/registry-12.07/services/RegistryQueryv1_0'
 DATABASE_FILE = "/srv/www/static/cdms/cdms_lite.db"
 
 #DATABASE_FILE = "/var/www/static/cdms/cdms_lite/cdms_lite_private.db"
+
+# Pragmas which are executed after the connection to the sqlite3 database
+# has been established. Note: journal_mode=WAL requires that the database
+# file is located on a local filesystem (not on NFS, etc.). page_size only takes
+# effect for new databases and has to precede journal_mode.
+SQLITE_PRAGMAS = ["PRAGMA page_size=8192",
+                  "PRAGMA journal_mode=WAL",
+                  "PRAGMA synchronous=NORMAL",
+                  "PRAGMA temp_store=MEMORY",
+                  "PRAGMA cache_size=-65536",
+                  "PRAGMA mmap_size=268435456",
+                  ]
+
 # Timeout for queries
 TIMEOUT = 600
+# Number of requests which are sent to VAMDC nodes in parallel
+NUM_REQUEST_THREADS = 8
@@ -487,6 +487,24 @@ def populate_models(xml, add_states=False):
     
 def calculate_partitionfunction(states, temperature = 300.0):
 
+    pfs = calculate_partitionfunctions(states, [temperature])
+    for specie in pfs:
+        pfs[specie] = pfs[specie][0]
+
+    return pfs
+
+def calculate_partitionfunctions(states, temperatures):
+    """
+    Calculates the partition functions of all species in states for a list of temperatures.
+    The sum over the states is evaluated for all temperatures at once.
+
+    states: dictionary of states (e.g. result.data['States'])
+    temperatures: list or array of temperatures
+
+    returns a dictionary with the species-id as key and an array of partition function
+    values (in the order of temperatures) as value.
+    """
+
     pfs = {}
     distinct_list = {}
     # create a distinct list of states
@@ -498,11 +516,10 @@ def calculate_partitionfunction(states, temperature = 300.0):
             distinct_list[id] = {}
         distinct_list[id][qn_string] = states[state]
 
+    inverse_temperatures = 1.0 / numpy.asarray(temperatures, dtype = numpy.float64)
     for specie in distinct_list:
-        pfs[specie] = 0
-        for state in distinct_list[specie]:
-            pfs[specie] += int(distinct_list[specie][state].TotalStatisticalWeight) * numpy.exp(-1.43878*float(distinct_list[specie][state].StateEnergyValue)/temperature)
-            
+        weights = numpy.array([int(s.TotalStatisticalWeight) for s in distinct_list[specie].values()])
+        energies = numpy.array([float(s.StateEnergyValue) for s in distinct_list[specie].values()])
+        pfs[specie] = numpy.dot(weights, numpy.exp(-1.43878 * numpy.outer(energies, inverse_temperatures)))
 
     return pfs
-        